@@ -7,38 +7,220 @@ import argparse
 import os
 import sys
 import math
+import io
+import gzip
+import lzma
+import json
+from functools import lru_cache
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 from matplotlib import font_manager as fm, rcParams
 import plotly
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import re
 
 # compatible with Chinese fonts
 plt.rcParams['font.sans-serif'] = 'SimHei'
 plt.rcParams['axes.unicode_minus'] = False
 
-def convert_csv(path, file):
-    # remove the first line to avoid converting error (not utf8)
-    os.system("sed -i -e '/Linux/d' " + path)
-    with open(file, 'w+', newline='') as csvfile:
-        csv_file = csv.writer(csvfile, dialect='excel')
-        with open(path, 'r', encoding='utf-8') as filein:
-            for line in filein:
-                if line.split():
-                    line_list = line.strip('\n').split()
-                    csv_file.writerow(line_list)
-
-def match_cpu_core(detail):
-    cpu = {}
-    def cpu_core(tgid_g, tid_g, core):
-        if tid_g.isdigit():
-            cpu.setdefault(tid_g, set()).add(core)
-        elif tgid_g.isdigit():
-            cpu.setdefault(tgid_g, set()).add(core)
-
-    detail.apply(lambda row: cpu_core(row['tgid'], row['tid'], row['cpu']), axis = 1)
-    return cpu
+# a line holding only a time, printed before each snapshot by the capture script
+TIME_LINE = r'^(\S*:\S*[^:\s])$'
+
+# log formats parsed by parse_log:
+#   columns: field names in order, None skips a field and the last one keeps the rest
+#            of the line; without it the names are taken from the first header line
+#   header:  regex of header lines, which are dropped
+#   match:   regex that a data line must match
+#   time:    regex whose first group is a time, found on a line of its own that stamps
+#            the rows after it, or at the start of every row if stamp is 'row'
+#   text:    columns kept as strings, every other one is converted to a number
+#   units:   'kB' (sizes in kB or with a k/m/g/t suffix), 'size' (only scaled when
+#            a suffix is given) and '%', all sizes are converted to M
+#   key:     column that tells the series apart, a trailing ':' is dropped from text keys
+#   label:   column that names a series and is matched by -pp, the key by default
+#   keys:    series shown by default
+#   rank:    (column, n) shows the n series with the highest mean of the column by default
+#   plot:    (column, axis title) drawn by stat_process if the log has the column
+SCHEMA = {
+    'tcmalloc': {
+        'columns': [None, None, None, 'mem', None, None, None, None, None, 'tid', None, None, None, None],
+        'match': r'^TCMALLOC_MINI\(USER\).*thread_one \d',
+        'text': ['tid'],
+        'key': 'tid'},
+    'procrank': {
+        'columns': ['pid', 'vss', 'rss', 'pss', 'uss', 'command'],
+        'time': TIME_LINE,
+        'text': ['command'],
+        'units': {'vss': 'kB', 'rss': 'kB', 'pss': 'kB', 'uss': 'kB'},
+        'key': 'command'},
+    'free': {
+        'columns': ['type', 'total', 'used', 'free', 'shared', 'buff/cache', 'available'],
+        'time': TIME_LINE,
+        'text': ['type'],
+        'units': {'total': 'kB', 'used': 'kB', 'free': 'kB', 'shared': 'kB', 'buff/cache': 'kB', 'available': 'kB'},
+        'key': 'type'},
+    'hogs': {
+        'columns': ['pid', 'name', 'msec', 'pids', 'sys', 'memory', 'mem%'],
+        'text': ['pid', 'name', 'memory'],
+        'units': {'pids': '%', 'sys': '%', 'mem%': '%'},
+        'key': 'pid'},
+    'iostat': {
+        'header': r'^Device:?\s',
+        'time': r'^(\d+/\d+/\d+ \d+:\d+:\d+(?: [AP]M)?|\d{4}-\d{2}-\d{2}T\S+)$',
+        'text': ['device'],
+        'key': 'device',
+        'plot': [('%util', 'Utilization(%)'), ('aqu-sz', 'Queue Size'), ('avgqu-sz', 'Queue Size')]},
+    'sar_dev': {
+        'header': r'^IFACE\s',
+        'time': r'^(\d+:\d+:\d+(?: [AP]M)?)\s+',
+        'stamp': 'row',
+        'text': ['iface'],
+        'key': 'iface',
+        'plot': [('rxkb/s', 'Receive(kB/s)'), ('txkb/s', 'Transmit(kB/s)')]},
+    'top': {
+        'header': r'^PID\s+USER\s',
+        'time': r'^top - (\d+:\d+:\d+)',
+        'text': ['user', 'pr', 's', 'time+', 'command'],
+        'units': {'virt': 'kB', 'res': 'kB', 'shr': 'kB'},
+        'key': 'pid',
+        'label': 'command',
+        'rank': ('%cpu', 10),
+        'plot': [('%cpu', 'CPU Usage(%)'), ('res', 'RES(M)')]},
+    'meminfo': {
+        'columns': ['field', 'value'],
+        'time': TIME_LINE,
+        'text': ['field'],
+        'units': {'value': 'size'},
+        'key': 'field',
+        'keys': ['MemFree', 'MemAvailable', 'Buffers', 'Cached', 'SwapFree'],
+        'plot': [('value', 'Size(M)')]},
+}
+
+def open_log(path):
+    # decompress on the fly, no temp file is written
+    ext = os.path.splitext(path)[1]
+    if ext == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8', errors='ignore')
+    if ext == '.xz':
+        return lzma.open(path, 'rt', encoding='utf-8', errors='ignore')
+    if ext == '.zst':
+        try:
+            import zstandard
+        except ImportError:
+            print("[Error] zstandard is required to read {}!".format(path))
+            sys.exit(1)
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd = True)
+        return io.TextIOWrapper(reader, encoding='utf-8', errors='ignore')
+    return open(path, 'r', encoding='utf-8', errors='ignore')
+
+def convert_csv(lines, file = ''):
+    buf = io.StringIO(newline='')
+    csv_file = csv.writer(buf, dialect='excel')
+    for line in lines:
+        # remove the first line to avoid converting error (not utf8)
+        if 'Linux' in line:
+            continue
+        if line.split():
+            line_list = line.strip('\n').split()
+            csv_file.writerow(line_list)
+    if len(file) != 0:
+        with open(file, 'w+', newline='') as csvfile:
+            csvfile.write(buf.getvalue())
+    buf.seek(0)
+    return buf
+
+def to_number(column, unit):
+    if unit == '%':
+        return pd.to_numeric(column.str.rstrip('%'), errors = 'coerce')
+    if unit in ['kB', 'size']:
+        part = column.str.extract(r'^([-\d.]+)\s*([kKmMgGtT]?)(?:i?B)?$')
+        scale = part[1].str.lower().map({'': 1.0, 'k': 1/1024, 'm': 1.0, 'g': 1024.0, 't': 1024.0**2})
+        if unit == 'kB':
+            scale[part[1] == ''] = 1/1024
+        return pd.to_numeric(part[0], errors = 'coerce') * scale
+    return pd.to_numeric(column, errors = 'coerce')
+
+def parse_log(name, lines):
+    schema = SCHEMA[name]
+    text = pd.Series([line.strip() for line in lines], dtype = object)
+    text = text[text != '']
+    if 'match' in schema:
+        text = text[text.str.match(schema['match'])]
+
+    time = None
+    if 'time' in schema:
+        stamp = text.str.extract(schema['time'], expand = False)
+        if schema.get('stamp') == 'row':
+            text = text[stamp.notna()].str.replace(schema['time'], '', regex = True)
+            time = stamp[stamp.notna()]
+        elif stamp.notna().any():
+            time = stamp.ffill().fillna('')[stamp.isna()]
+            text = text[stamp.isna()]
+
+    column = schema.get('columns')
+    if 'header' in schema:
+        header = text.str.contains(schema['header'])
+        if column is None:
+            if not header.any():
+                print("[Error] header of {} log is not found!".format(name))
+                sys.exit(1)
+            # older sysstat prints 'Device:'
+            column = [c.rstrip(':') for c in text[header].iloc[0].lower().split()]
+        text = text[~header]
+
+    data = text.str.split(n = len(column)-1, expand = True)
+    data = data.reindex(columns = range(len(column)))
+    data.columns = range(len(column))
+    data = data[[i for i, c in enumerate(column) if c is not None]]
+    data.columns = [c for c in column if c is not None]
+    if time is not None:
+        data['time'] = time
+
+    # header, total and other summary lines have no number where one is expected
+    number = [c for c in data.columns if c not in schema.get('text', []) + ['time']]
+    units = schema.get('units', {})
+    data = data.dropna(axis = 0, how = 'any', subset = number + [schema['key']])
+    if len(data) == 0:
+        # columns of an empty frame are float, not text with a unit
+        return data.reset_index(drop = True)
+    for c in number:
+        data[c] = to_number(data[c], units.get(c, ''))
+    data = data.dropna(axis = 0, how = 'any', subset = number)
+    if schema['key'] in schema.get('text', []):
+        # 'Mem:' of free and 'MemFree:' of meminfo, so -pp takes the plain name
+        data[schema['key']] = data[schema['key']].str.rstrip(':')
+    # a column that had an invalid value was read as float
+    for c in number:
+        if c not in units and (data[c] % 1 == 0).all():
+            data[c] = data[c].astype('int64')
+    return data.reset_index(drop = True)
+
+def core_occupancy(detail, intervals = None):
+    # process summary rows (tgid=N, tid=-) are left out, only threads are spread over cores
+    data = detail[detail['tid'].str.isdigit() | detail['tgid'].str.isdigit()]
+    if intervals is None:
+        # pidstat skips idle tasks, so count the intervals of the whole capture
+        time = data.index.to_series()
+        intervals = int((time != time.shift()).sum())
+    detail = data[(data['tgid'] == '-') & data['tid'].str.isdigit()]
+    status = [c for c in detail.columns if c.startswith('%')]
+    rows = detail[status].astype(float)
+    rows.insert(0, 'tid', detail['tid'].values)
+    rows.insert(1, 'cpu', detail['cpu'].astype(int).values)
+    rows = rows.reset_index(drop = True)
+
+    # sparse tid x core matrix: only the cores a thread was sampled on
+    samples = rows.groupby('tid').size()
+    cell = rows.groupby(['tid', 'cpu'])
+    occupancy = cell[status].sum() / max(intervals, 1)
+    occupancy['%time'] = cell.size().div(samples, level = 'tid') * 100
+    occupancy = round(occupancy, 2)
+
+    # a migration is a core change between two consecutive samples of a thread
+    prev = rows.groupby('tid')['cpu'].shift()
+    migrations = (prev.notna() & (prev != rows['cpu'])).groupby(rows['tid']).sum()
+    return occupancy, migrations
 
 def gen_pidstat_thread_graph(data, thread, p_status, p_process, output):
     thread_data = filter_process(data, p_process)
@@ -55,26 +237,18 @@ def gen_data(data, thread, p_status, p_process, output):
     detail = data[~data.index.isin(['Average:'])]
     if len(thread) != 0:
         gen_pidstat_thread_graph(detail, thread, p_status, p_process, output)
-    cpu = match_cpu_core(detail)
+    occupancy, migrations = core_occupancy(detail)
 
     # get rows that contain 'Average:'
     avg = data[data.index.isin(['Average:'])]
     avg = avg.reset_index(drop=True)
     avg = avg.drop(index=[0], axis = 0)
-
-    def get_cpu_core(tgid, tid):
-        return sorted(list(map(int, cpu[tid] if tid.isdigit() else cpu[tgid])))
-    avg['cpu'] = avg.apply(lambda row: get_cpu_core(row['tgid'], row['tid']), axis = 1)
-    return avg
+    avg['migrations'] = avg['tid'].map(migrations)
+    return avg, occupancy
 
 def add_process(data):
-    process = ""
-    def get_process(tgid, command):
-        global process
-        if tgid.isdigit():
-            process = command
-        return process
-    data['process'] = data.apply(lambda row: get_process(row['tgid'], row['command']), axis = 1)
+    # threads follow the row of their main process
+    data['process'] = data['command'].where(data['tgid'].str.isdigit()).ffill().fillna('')
 
 def filter_process(data, p_process):
     data = data[data['tgid'].isin(['-'])]
@@ -112,10 +286,10 @@ def set_bar_chart_param(data, ax, title, cpu_status):
 
 def gen_pidstat_graph(data, cpu_status, title, output):
     graph_num = len(title)
-    fig, axs = plt.subplots(graph_num, figsize = (20, graph_num*5))
+    fig, axs = plt.subplots(graph_num, figsize = (20, graph_num*5), squeeze = False)
     plt.subplots_adjust(hspace=0.4)
     for i, t in enumerate(title):
-        set_bar_chart_param(data[i], axs[i], t, cpu_status)
+        set_bar_chart_param(data[i], axs[i, 0], t, cpu_status)
     plt.savefig(output + "/pidstat_bar.jpg", bbox_inches = 'tight')
 
 def auto_text(rects, ax):
@@ -123,31 +297,25 @@ def auto_text(rects, ax):
         height = rect.get_height()
         ax.text(rect.get_x() + rect.get_width()/2, height+0.01*height, rect.get_height(), ha='center', va='bottom', fontsize=10)
 
-def sort_by_cpu(data, core, cpu_status, output):
-    # add a new column for length of 'CPU'
-    data['len'] = data.apply(lambda row: len(row['cpu']), axis = 1)
-    data = data.sort_values(by = 'len' , ascending = True)
-    data_s = data.loc[data['len'] == 1].sort_values(by = 'cpu', ascending = True)
-    data_m = data.loc[data['len'] != 1]
-    data = data_s.append(data_m)
+def sort_by_cpu(data, occupancy, core, cpu_status, output):
+    # spread each thread over the cores it ran on, weighted by its load there
+    column = [c for c in data.columns if c != 'cpu' and c not in occupancy.columns]
+    data = data[column].merge(occupancy.reset_index(), on = 'tid')
+    # every thread left after the merge has a count, process rows had none
+    data['migrations'] = data.pop('migrations').astype(int)
+    data = data.sort_values(by = ['cpu', 'process', 'tid'], ascending = True, ignore_index = True)
 
-    # transform list to str
-    data['cpu'] = data['cpu'].apply(lambda row: ','.join(str(i) for i in row))
     cpu_data = []
     title = []
     for i, cpu in enumerate(core):
-        core_data = data[(data['cpu'].isin([cpu])) & (data['len'] == 1)]
+        core_data = data[data['cpu'].astype(str) == cpu]
         if len(core_data) != 0:
-            cpu_data.append(core_data.sort_values(by = ['process', 'tid'], ascending = True))
+            cpu_data.append(core_data.copy())
             title.append('CPU'+cpu)
-
-    cpu_unbound = data.loc[data['len'] != 1].sort_values(by = ['process', 'tid'], ascending = True)
-    if len(cpu_unbound) != 0:
-        cpu_data.append(cpu_unbound)
-        title.append('Other_CPU')
-    gen_pidstat_graph(cpu_data, cpu_status, title, output)
-    data = pd.concat(cpu_data, axis = 0, ignore_index = True)
-    data = data.drop(columns=['len'])
+        else:
+            print("[Warning] no thread ran on CPU core {}".format(cpu))
+    if len(cpu_data) != 0:
+        gen_pidstat_graph(cpu_data, cpu_status, title, output)
     return data
 
 def set_line_chart_param(cpu_data, cpu_status, title, y_label):
@@ -213,8 +381,7 @@ def gen_mpstat_graph(data, core, cpu_status, output, is_picture):
     for i, cpu in enumerate(core):
         cpu_data = detail[detail['cpu'].isin([cpu])]
         if len(cpu_data) != 0:
-            subgraph_pos = str(graph_num) + '1' + str(i+1)
-            plt.subplot(int(subgraph_pos))
+            plt.subplot(graph_num, 1, i+1)
             plt.grid(linestyle = '--')
             set_line_chart_param(cpu_data, cpu_status, 'CPU'+cpu, 'CPU Usage(%)')
         else:
@@ -222,6 +389,45 @@ def gen_mpstat_graph(data, core, cpu_status, output, is_picture):
 
     plt.savefig(output + "/mpstat_line.jpg", bbox_inches='tight')
 
+def gen_mpstat_heatmap(data, cpu_status, output, is_picture, mpstat_summary):
+    detail = data[~data.index.isin(['Average:'])]
+    detail = detail[detail['cpu'] != 'all']
+    time = detail.index.to_series()
+    sample = (time != time.shift()).cumsum().values - 1
+    detail = detail[['cpu'] + cpu_status].astype(float)
+    detail['sample'] = sample
+    label = time.groupby(sample).first()
+
+    # one pivot for all metrics: a row per core, a (metric, sample) column per cell
+    table = round(detail.groupby(['cpu', 'sample'])[cpu_status].mean().unstack('sample'), 2)
+    core = ['CPU' + str(int(i)) for i in table.index]
+
+    fig = make_subplots(rows=len(cpu_status), cols=1, shared_xaxes=True, subplot_titles=cpu_status)
+    for i, status in enumerate(cpu_status):
+        fig.add_trace(go.Heatmap(z = table[status].values,
+                                 x = label[table[status].columns].values,
+                                 y = core,
+                                 coloraxis = 'coloraxis',
+                                 name = status),
+                      row = i+1, col = 1)
+        fig.update_yaxes(title_text = 'CPU Core', row = i+1, col = 1)
+    fig.update_xaxes(title_text = 'Time', row = len(cpu_status), col = 1)
+    fig.update_layout(title = 'CPU Usage of Each Core',
+                      coloraxis = {'colorscale': 'Viridis', 'cmin': 0, 'cmax': 100, 'colorbar': {'title': 'Usage(%)'}},
+                      height = 400*len(cpu_status))
+    if not is_picture:
+        fig.write_html(output + '/' + 'mpstat_heatmap.html')
+    else:
+        fig.write_image(output + '/' + 'mpstat_heatmap.jpg', width = 1500, height = 400*len(cpu_status))
+
+    if mpstat_summary:
+        summary = detail.groupby('cpu')[cpu_status].describe(percentiles = [0.5, 0.95])
+        summary = summary.drop(columns = 'count', level = 1)
+        summary.columns = [s + ' ' + f for s, f in summary.columns]
+        summary.index = core
+        summary.index.name = 'cpu'
+        round(summary, 2).to_csv(output + '/mpstat_summary.csv')
+
 def gen_sunburst_graph(data, output, is_picture):
     data['command']=data['command'].map(lambda x: x[3:] if x[0:3]=='|__' else x)
     data['%cpu']=data['%cpu'].map(lambda x: str(x)+'%')
@@ -235,12 +441,14 @@ def gen_sunburst_graph(data, output, is_picture):
 def gen_pidstat_cpu_graph(data, p_status, thread, p_process, output, core, is_picture):
     data.dropna(axis = 0, how = 'any', inplace = True)
     cpu_status = ['%'+i for i in p_status]
-    avg = gen_data(data, thread, cpu_status, p_process, output)
+    avg, occupancy = gen_data(data, thread, cpu_status, p_process, output)
     add_process(avg)
     # remove row of main process
     avg = filter_process(avg, p_process)
-    avg = sort_by_cpu(avg, core, cpu_status, output)
-    gen_sunburst_graph(avg, output, is_picture)
+    avg = sort_by_cpu(avg, occupancy, core, cpu_status, output)
+    core_avg = avg[avg['cpu'].astype(str).isin(core)]
+    if len(core_avg) != 0:
+        gen_sunburst_graph(core_avg.copy(), output, is_picture)
     file = 'pidstat_cpu.csv'
     avg.to_csv(output + '/' + file, index = False)
 
@@ -396,18 +604,21 @@ def gen_pidstat_mem_graph(data, p_process, output, is_picture):
     else:
         fig.write_image(output + '/' + 'pidstat_mem.jpg', width = 1500, height = 500*len(processes))
 
-def pidstat_process(pidstat_path, core, thread, p_status, p_process, output, pidstat_t, pidstat_r, pidstat_d, is_picture):
+def load_pidstat(pidstat_path, output, save_csv):
     if not os.path.exists(pidstat_path):
         print("[Error] {} does not exist!".format(pidstat_path))
         sys.exit(1)
     print("pidstat_path={}".format(pidstat_path))
 
     # convert to csv file
-    file = 'pidstat.csv'
-    convert_csv(pidstat_path, output + '/' + file)
-    data = pd.read_csv(output + '/' + file, header = 0, index_col = 0)
+    file = output + '/pidstat.csv' if save_csv else ''
+    with open_log(pidstat_path) as f:
+        data = pd.read_csv(convert_csv(f, file), header = 0, index_col = 0)
     data.columns = data.columns.map(lambda x:x.lower())
+    return data
 
+def pidstat_process(pidstat_path, core, thread, p_status, p_process, output, pidstat_t, pidstat_r, pidstat_d, is_picture, save_csv):
+    data = load_pidstat(pidstat_path, output, save_csv)
     if pidstat_t:
         gen_pidstat_cpu_graph(data, p_status, thread, p_process, output, core, is_picture)
     if pidstat_r:
@@ -415,23 +626,29 @@ def pidstat_process(pidstat_path, core, thread, p_status, p_process, output, pid
     if pidstat_d:
         gen_pidstat_io_graph(data, p_process, output, is_picture)
 
-def mpstat_process(mpstat_path, core, m_status, output, is_picture):
+def load_mpstat(mpstat_path, output, save_csv):
     if not os.path.exists(mpstat_path):
         print("[Error] {} does not exist!".format(mpstat_path))
         sys.exit(1)
     print("mpstat_path={}".format(mpstat_path))
 
     # convert to csv file
-    file = 'mpstat.csv'
-    convert_csv(mpstat_path, output + '/' + file)
-    data = pd.read_csv(output + '/' + file, header=0, index_col=0)
+    with open_log(mpstat_path) as f:
+        data = pd.read_csv(convert_csv(f), header=0, index_col=0)
     data.dropna(axis = 0, how = 'any', inplace = True)
     data.columns = data.columns.map(lambda x:x.lower())
     data = data[data['cpu'] != 'CPU']
-    data.to_csv(output + '/' + file, index = False)
+    if save_csv:
+        data.to_csv(output + '/mpstat.csv', index = False)
+    return data
 
+def mpstat_process(mpstat_path, core, m_status, output, is_picture, save_csv, mpstat_heatmap, mpstat_summary):
+    data = load_mpstat(mpstat_path, output, save_csv)
     cpu_status = ['%'+i for i in m_status]
-    gen_mpstat_graph(data, core, cpu_status, output, is_picture)
+    if mpstat_heatmap:
+        gen_mpstat_heatmap(data, cpu_status, output, is_picture, mpstat_summary)
+    else:
+        gen_mpstat_graph(data, core, cpu_status, output, is_picture)
 
 def gen_vmstat_graph(data, v_status, title, y_label, output):
     graph_num = len(title)
@@ -448,16 +665,16 @@ def gen_vmstat_graph(data, v_status, title, y_label, output):
 
     plt.savefig(output + "/vmstat_line.jpg", bbox_inches='tight')
 
-def vmstat_process(vmstat_path, vmstat_mem, vmstat_io, vmstat_system, vmstat_cpu, output):
+def load_vmstat(vmstat_path, output, save_csv):
     if not os.path.exists(vmstat_path):
         print("[Error] {} does not exist!".format(vmstat_path))
         sys.exit(1)
     print("vmstat_path={}".format(vmstat_path))
 
     # convert to csv file
-    file = 'vmstat.csv'
-    convert_csv(vmstat_path, output + '/' + file)
-    data = pd.read_csv(output + '/' + file, header=1)
+    file = output + '/vmstat.csv' if save_csv else ''
+    with open_log(vmstat_path) as f:
+        data = pd.read_csv(convert_csv(f, file), header=1)
     data.dropna(axis = 0, how = 'any', inplace = True)
     data.columns = data.columns.map(lambda x:x.lower())
     v_data = data[data.r.apply(lambda x: x.isnumeric())]
@@ -466,7 +683,10 @@ def vmstat_process(vmstat_path, vmstat_mem, vmstat_io, vmstat_system, vmstat_cpu
     v_data['free'] = v_data['free'].map(lambda x: float(x)/1024)
     v_data['buff'] = v_data['buff'].map(lambda x: float(x)/1024)
     v_data['cache'] = v_data['cache'].map(lambda x: float(x)/1024)
+    return v_data
 
+def vmstat_process(vmstat_path, vmstat_mem, vmstat_io, vmstat_system, vmstat_cpu, output, save_csv):
+    v_data = load_vmstat(vmstat_path, output, save_csv)
     title = []
     v_status = []
     y_label = []
@@ -488,34 +708,24 @@ def vmstat_process(vmstat_path, vmstat_mem, vmstat_io, vmstat_system, vmstat_cpu
         y_label.append('CPU Usage(%)')
     gen_vmstat_graph(v_data, v_status, title, y_label, output)
 
-def filter_log(path, output, pattern):
-    org_output = sys.stdout
-    with open(path, 'r', encoding='UTF-8',errors='ignore') as f:
-        output_file = open(output, 'w')
-        sys.stdout = output_file
-        res = re.compile(pattern)
-        for line in f:
-            m = res.match(line)
-            if m is not None:
-                print(line)
-        output_file.close()
-    sys.stdout = org_output
-
-def tcmalloc_process(tcmalloc_path, output, is_picture):
-    if not os.path.exists(tcmalloc_path):
-        print("[Error] {} does not exist!".format(tcmalloc_path))
+def read_stat(name, stat_path, output, save_csv):
+    if not os.path.exists(stat_path):
+        print("[Error] {} does not exist!".format(stat_path))
         sys.exit(1)
-    print("tcmalloc_path={}".format(tcmalloc_path))
+    print("{}_path={}".format(name, stat_path))
+
+    with open_log(stat_path) as f:
+        data = parse_log(name, f)
+    if len(data) == 0:
+        print("[Warning] nothing to display in {} log".format(name))
+    if save_csv:
+        data.to_csv(output + '/' + name + '.csv', index = False)
+    return data
 
-    tcmalloc_file = 'tcmalloc.log'
-    filter_log(tcmalloc_path, output+'/'+tcmalloc_file, r'(.*)(^TCMALLOC_MINI\(USER\).*thread_one \d)')
-    # convert to csv file
-    file = 'tcmalloc.csv'
-    convert_csv(output+'/'+tcmalloc_file, output + '/' + file)
-    column = ['c1', 'c2', 'c3', 'mem', 'c4', 'c5', 'c6', 'c7', 'c8', 'tid', 'c10', 'c11', 'c12', 'c13']
-    data = pd.read_csv(output + '/' + file, header = 0, index_col = 0,
-                       names = column)
-    data.dropna(axis = 0, how = 'any', inplace = True)
+def tcmalloc_process(tcmalloc_path, output, is_picture, save_csv):
+    data = read_stat('tcmalloc', tcmalloc_path, output, save_csv)
+    if len(data) == 0:
+        return
     data_g = data.groupby('tid', sort = False)
 
     fig = make_subplots(rows=len(data_g.size().index), cols=1, subplot_titles=list(map(str, data_g.size().index)))
@@ -535,38 +745,10 @@ def tcmalloc_process(tcmalloc_path, output, is_picture):
     else:
         fig.write_image(output + '/' + 'tcmalloc.jpg', width = 1500, height = 500*len(data_g.size().index))
 
-def time_column(data, column):
-    data[column] = data[column].astype(str)
-    
-    if len(data.loc[data[column].str.contains(':') & ~data[column].str.endswith(':')]) != 0:
-        # add new column for time
-        time = ''
-        def get_time(data):
-            global time
-            if data.find(':') != -1 and not data.endswith(':'):
-                time = data
-            return time
-        data['time'] = data.apply(lambda row: get_time(row[column]), axis = 1)
-
-def procrank_process(procrank_path, output, p_process, is_picture):
-    if not os.path.exists(procrank_path):
-        print("[Error] {} does not exist!".format(procrank_path))
-        sys.exit(1)
-    print("procrank_path={}".format(procrank_path))
-
-    # convert to csv file
-    file = 'procrank.csv'
-    convert_csv(procrank_path, output + '/' + file)
-    column = ['pid', 'vss', 'rss', 'pss', 'uss', 'command']
-    data = pd.read_csv(output + '/' + file, names = column)
-
-    time_column(data, 'pid')
-    data.dropna(axis = 0, how = 'any', inplace = True)
-    data['vss'] = data['vss'].apply(lambda row: float(row.rstrip('K'))/1024)
-    data['rss'] = data['rss'].apply(lambda row: float(row.rstrip('K'))/1024)
-    data['pss'] = data['pss'].apply(lambda row: float(row.rstrip('K'))/1024)
-    data['uss'] = data['uss'].apply(lambda row: float(row.rstrip('K'))/1024)
-
+def procrank_process(procrank_path, output, p_process, is_picture, save_csv):
+    data = read_stat('procrank', procrank_path, output, save_csv)
+    if len(data) == 0:
+        return
     data_g = data.groupby('command', sort = False)
     if len(p_process) != 0:
         processes = p_process
@@ -605,28 +787,16 @@ def procrank_process(procrank_path, output, p_process, is_picture):
     else:
         fig.write_image(output + '/' + 'procrank.jpg', width = 1500, height = 500*len(processes))
 
-def free_process(free_path, output, is_picture):
-    if not os.path.exists(free_path):
-        print("[Error] {} does not exist!".format(free_path))
-        sys.exit(1)
-    print("free_path={}".format(free_path))
-
-    # convert to csv file
-    file = 'free.csv'
-    convert_csv(free_path, output + '/' + file)
-    column = ['type', 'total', 'used', 'free', 'shared', 'buff/cache', 'available']
-    data = pd.read_csv(output + '/' + file, names = column)
-
-    time_column(data, 'type')
-    data.columns = data.columns.map(lambda x:x.lower())
-    data.dropna(axis = 0, how = 'any', inplace = True)
-    data['available'] = data['available'].apply(lambda row: float(row)/1024)
-    data_x = data.loc[data['type'] == 'Mem:'].time if 'time' in data.columns \
-            else np.arange(0, len(data.loc[data['type'] == 'Mem:'].available))
+def free_process(free_path, output, is_picture, save_csv):
+    data = read_stat('free', free_path, output, save_csv)
+    if len(data) == 0:
+        return
+    data_x = data.loc[data['type'] == 'Mem'].time if 'time' in data.columns \
+            else np.arange(0, len(data.loc[data['type'] == 'Mem'].available))
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(x = data_x,
-                             y = data.loc[data['type'] == 'Mem:'].available,
+                             y = data.loc[data['type'] == 'Mem'].available,
                              mode = 'lines',
                              fill = 'tozeroy',
                              name = 'available',
@@ -640,22 +810,12 @@ def free_process(free_path, output, is_picture):
     else:
         fig.write_image(output + '/' + 'free.jpg')
 
-def hogs_process(hogs_path, output, thread, is_picture):
-    if not os.path.exists(hogs_path):
-        print("[Error] {} does not exist!".format(hogs_path))
-        sys.exit(1)
-    print("hogs_path={}".format(hogs_path))
-
-    # convert to csv file
-    file = 'hogs.csv'
-    convert_csv(hogs_path, output + '/' + file)
-    column = ['PID', 'NAME', 'MSEC', 'PIDS', 'SYS', 'MEMORY', 'MEM%']
-    data = pd.read_csv(output + '/' + file, names = column)
-
-    data.columns = data.columns.map(lambda x:x.lower())
-    data['sys'] = data['sys'].apply(lambda row: row.rstrip('%'))
+def hogs_process(hogs_path, output, thread, is_picture, save_csv):
+    data = read_stat('hogs', hogs_path, output, save_csv)
+    if len(data) == 0:
+        return
     if len(thread) != 0:
-        data = data[data['pid'] == int(thread)]
+        data = data[data['pid'] == thread]
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(x = np.arange(0, len(data['sys'])),
@@ -673,6 +833,210 @@ def hogs_process(hogs_path, output, thread, is_picture):
     else:
         fig.write_image(output + '/' + 'hogs.jpg')
 
+def stat_process(name, stat_path, output, p_process, is_picture, save_csv):
+    schema = SCHEMA[name]
+    data = read_stat(name, stat_path, output, save_csv)
+    if len(data) == 0:
+        return
+    plot = [(column, y_label) for column, y_label in schema['plot'] if column in data.columns]
+    data_g = data.groupby(schema['key'], sort = False)
+    label = data_g[schema.get('label', schema['key'])].first()
+    if len(p_process) != 0:
+        keys = label[label.isin(p_process)].index if 'label' in schema else p_process
+    elif 'rank' in schema:
+        column, n = schema['rank']
+        keys = data_g[column].mean().nlargest(n).index
+    else:
+        keys = schema.get('keys', data_g.size().index)
+    keys = [k for k in keys if k in data_g.groups]
+    if len(keys) == 0 or len(plot) == 0:
+        print("[Warning] nothing to display in {} log".format(name))
+        return
+
+    title = []
+    for k in keys:
+        series = '{} ({})'.format(label[k], k) if 'label' in schema else k
+        for column, y_label in plot:
+            title.append('{} of {}'.format(column, series))
+    fig = make_subplots(rows=len(keys), cols=len(plot), subplot_titles=title)
+
+    for i, k in enumerate(keys):
+        d = data_g.get_group(k)
+        data_x = d.time if 'time' in d.columns else np.arange(0, len(d))
+        for j, (column, y_label) in enumerate(plot):
+            fig.add_trace(go.Scatter(x = data_x,
+                                     y = d[column],
+                                     mode = 'lines',
+                                     fill = 'tozeroy',
+                                     showlegend = False),
+                          row = i+1, col = j+1)
+            fig.update_yaxes(title_text = y_label, row = i+1, col = j+1)
+            fig.update_xaxes(title_text = 'Time', row = i+1, col = j+1)
+
+    fig.update_layout(title = name + ' Statistics', height = 500*len(keys))
+    if not is_picture:
+        fig.write_html(output + '/' + name + '.html')
+    else:
+        fig.write_image(output + '/' + name + '.jpg', width = 1500, height = 500*len(keys))
+
+def index_table(data, keys):
+    # number the samples in log order, a new sample starts when the time changes
+    time = data.index.to_series().astype(str)
+    sample = (time != time.shift()).cumsum().values - 1
+    data = data.reset_index(drop = True)
+    data.insert(0, 'time', time.values)
+    data.insert(0, 'sample', sample)
+    label = data.groupby('time')['sample']
+    return {'data': data,
+            'index': {k: data.groupby(k).indices for k in keys if k in data.columns},
+            'first': label.min().to_dict(),
+            'last': label.max().to_dict()}
+
+def load_capture(pidstat_path, mpstat_path, vmstat_path, output):
+    capture = {}
+    if len(pidstat_path) != 0:
+        data = load_pidstat(pidstat_path, output, False)
+        if 'tid' not in data.columns:
+            print("[Error] only pidstat logs recorded with -t can be served!")
+            sys.exit(1)
+        data = data[~data.index.isin(['Average:'])]
+        data = data[data['tid'].str.isdigit() | data['tgid'].str.isdigit()].copy()
+        add_process(data)
+        status = [c for c in data.columns if c.startswith('%')]
+        data[status] = data[status].astype(float)
+        capture['pidstat'] = index_table(data, ['process', 'command', 'tgid', 'tid', 'cpu'])
+    if len(mpstat_path) != 0:
+        data = load_mpstat(mpstat_path, output, False)
+        data = data[~data.index.isin(['Average:'])].copy()
+        status = [c for c in data.columns if c.startswith('%')]
+        data[status] = data[status].astype(float)
+        capture['mpstat'] = index_table(data, ['cpu'])
+    if len(vmstat_path) != 0:
+        data = load_vmstat(vmstat_path, output, False).astype(float)
+        data.index = np.arange(len(data))
+        capture['vmstat'] = index_table(data, [])
+    return capture
+
+def sample_of(table, value, edge):
+    if value.isdigit():
+        return int(value)
+    if value not in table[edge]:
+        raise ValueError("unknown time {}".format(value))
+    return table[edge][value]
+
+def sample_range(table, params):
+    start = sample_of(table, params['start'][0], 'first') if 'start' in params else 0
+    end = sample_of(table, params['end'][0], 'last') if 'end' in params else table['data']['sample'].iloc[-1]
+    return start, end
+
+def query_table(table, params):
+    data = table['data']
+    sample = data['sample'].values
+    start, end = sample_range(table, params)
+    pos = np.arange(np.searchsorted(sample, start, 'left'), np.searchsorted(sample, end, 'right'))
+    for key, index in table['index'].items():
+        if key in params:
+            hit = [index[v] for v in params[key] if v in index]
+            pos = np.intersect1d(pos, np.concatenate(hit) if len(hit) != 0 else [], assume_unique = True)
+    return data.iloc[pos]
+
+def render_chart(data, status, title, y_label, how):
+    frame = data.groupby('sample').agg(dict({'time': 'first'}, **{s: how for s in status}))
+    frame = frame.set_index('time')
+    fig = plt.figure(figsize = (20, 10))
+    plt.grid(linestyle = '--')
+    set_line_chart_param(frame, status, title, y_label)
+    buf = io.BytesIO()
+    fig.savefig(buf, format = 'png', bbox_inches = 'tight')
+    plt.close(fig)
+    return buf.getvalue()
+
+def serve_capture(capture, port):
+    # status shown by default and how samples of several rows are combined
+    chart_param = {'pidstat': (['%usr', '%system', '%cpu'], 'CPU Usage(%)', 'sum'),
+                   'mpstat': (['%usr', '%sys', '%iowait', '%idle'], 'CPU Usage(%)', 'mean'),
+                   'vmstat': (['swpd', 'free', 'buff', 'cache'], 'Value', 'mean')}
+
+    def parse(query):
+        return {k: ','.join(v).split(',') for k, v in parse_qs(query).items()}
+
+    def summary():
+        return {name: {'rows': len(table['data']),
+                       'samples': int(table['data']['sample'].iloc[-1]) + 1 if len(table['data']) != 0 else 0,
+                       'start': table['data']['time'].iloc[0] if len(table['data']) != 0 else '',
+                       'end': table['data']['time'].iloc[-1] if len(table['data']) != 0 else '',
+                       'columns': table['data'].columns.tolist(),
+                       'keys': {k: sorted(index.keys()) for k, index in table['index'].items()}}
+                for name, table in capture.items()}
+
+    # charts are only drawn when asked for, and kept for repeated queries
+    @lru_cache(maxsize = 128)
+    def chart(name, query):
+        params = parse(query)
+        status, y_label, how = chart_param[name]
+        if 'status' in params:
+            status = [('%' if name != 'vmstat' else '') + s for s in params['status']]
+        data = query_table(capture[name], params)
+        if name == 'pidstat':
+            # the process rows already hold the sum of their threads
+            data = data[data['tgid'] == '-']
+        for s in status:
+            if s not in data.columns:
+                raise ValueError("unknown status {}".format(s))
+        if len(data) == 0:
+            raise ValueError("no data matched")
+        title = name
+        if name == 'pidstat' and len(params.get('tid', [])) == 1:
+            title = 'Thread ' + params['tid'][0]
+        elif name == 'mpstat' and len(params.get('cpu', [])) == 1:
+            title = 'CPU' + params['cpu'][0]
+        return render_chart(data, status, title, y_label, how)
+
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, code, body, content_type = 'application/json; charset=utf-8'):
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path = url.path.strip('/').split('/')
+            try:
+                if path == ['']:
+                    self.reply(200, json.dumps(summary(), ensure_ascii = False))
+                elif len(path) == 1 and path[0] in capture:
+                    data = query_table(capture[path[0]], parse(url.query))
+                    self.reply(200, data.to_json(orient = 'records', force_ascii = False))
+                elif path == ['pidstat', 'cores'] and 'pidstat' in capture:
+                    params = parse(url.query)
+                    # every core a thread ran on counts for %time and migrations,
+                    # so the requested cores are only picked from the result
+                    core = params.pop('cpu', None)
+                    start, end = sample_range(capture['pidstat'], params)
+                    occupancy, migrations = core_occupancy(query_table(capture['pidstat'], params), end - start + 1)
+                    occupancy = occupancy.reset_index()
+                    occupancy['migrations'] = occupancy['tid'].map(migrations)
+                    if core is not None:
+                        occupancy = occupancy[occupancy['cpu'].astype(str).isin(core)]
+                    self.reply(200, occupancy.to_json(orient = 'records', force_ascii = False))
+                elif len(path) == 2 and path[0] == 'chart' and path[1] in capture:
+                    self.reply(200, chart(path[1], url.query), 'image/png')
+                else:
+                    self.reply(404, json.dumps({'error': 'unknown path ' + url.path}))
+            except ValueError as e:
+                self.reply(400, json.dumps({'error': str(e)}, ensure_ascii = False))
+
+    server = HTTPServer(('127.0.0.1', port), Handler)
+    print("serving on http://127.0.0.1:{}".format(port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
 def main(args):
     pidstat_path = args.pidstat
     pidstat_t = args.pidstat_t
@@ -684,6 +1048,8 @@ def main(args):
 
     mpstat_path = args.mpstat
     m_status = args.m_status
+    mpstat_heatmap = args.mpstat_heatmap
+    mpstat_summary = args.mpstat_summary
 
     vmstat_path = args.vmstat
     vmstat_mem = args.vmstat_mem
@@ -699,6 +1065,12 @@ def main(args):
     free_path = args.free
     is_picture = args.picture
     hogs_path = args.hogs
+    save_csv = args.save_csv
+    iostat_path = args.iostat
+    sar_dev_path = args.sar_dev
+    top_path = args.top
+    meminfo_path = args.meminfo
+    serve = args.serve
 
     if len(output) == 0:
         output = os.getcwd()
@@ -708,20 +1080,32 @@ def main(args):
             sys.exit(1)
     print("output={}".format(output))
 
+    if serve != 0:
+        serve_capture(load_capture(pidstat_path, mpstat_path, vmstat_path, output), serve)
+        return
+
     if len(pidstat_path) != 0:
-        pidstat_process(pidstat_path, core, thread, p_status, p_process, output, pidstat_t, pidstat_r, pidstat_d, is_picture)
+        pidstat_process(pidstat_path, core, thread, p_status, p_process, output, pidstat_t, pidstat_r, pidstat_d, is_picture, save_csv)
     if len(mpstat_path) != 0:
-        mpstat_process(mpstat_path, core, m_status, output, is_picture)
+        mpstat_process(mpstat_path, core, m_status, output, is_picture, save_csv, mpstat_heatmap, mpstat_summary)
     if len(vmstat_path) != 0:
-        vmstat_process(vmstat_path, vmstat_mem, vmstat_io, vmstat_system, vmstat_cpu, output)
+        vmstat_process(vmstat_path, vmstat_mem, vmstat_io, vmstat_system, vmstat_cpu, output, save_csv)
     if len(tcmalloc_path) != 0:
-        tcmalloc_process(tcmalloc_path, output, is_picture)
+        tcmalloc_process(tcmalloc_path, output, is_picture, save_csv)
     if len(procrank_path) != 0:
-        procrank_process(procrank_path, output, p_process, is_picture)
+        procrank_process(procrank_path, output, p_process, is_picture, save_csv)
     if len(free_path) != 0:
-        free_process(free_path, output, is_picture)
+        free_process(free_path, output, is_picture, save_csv)
     if len(hogs_path) != 0:
-        hogs_process(hogs_path, output, thread, is_picture)
+        hogs_process(hogs_path, output, thread, is_picture, save_csv)
+    if len(iostat_path) != 0:
+        stat_process('iostat', iostat_path, output, p_process, is_picture, save_csv)
+    if len(sar_dev_path) != 0:
+        stat_process('sar_dev', sar_dev_path, output, p_process, is_picture, save_csv)
+    if len(top_path) != 0:
+        stat_process('top', top_path, output, p_process, is_picture, save_csv)
+    if len(meminfo_path) != 0:
+        stat_process('meminfo', meminfo_path, output, p_process, is_picture, save_csv)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Data cleaning and visualization tools.")
@@ -733,6 +1117,8 @@ if __name__ == "__main__":
     parser.add_argument("-pp", "--p_process", type=str, default=[], nargs='*', help="The process that needs to be displayed.")
     parser.add_argument("-m", "--mpstat", type=str, default="", help="Path of mpstat log.")
     parser.add_argument("-ms", "--m_status", type=str, default=['usr', 'sys', 'iowait', 'idle'], nargs='*', help="The status of mpstat. eg. usr sys idle")
+    parser.add_argument("-mh", "--mpstat_heatmap", action='store_true', default=False, help="Show all CPU cores as a heatmap per status instead of line and pie charts.")
+    parser.add_argument("-msum", "--mpstat_summary", action='store_true', default=False, help="Save statistics of each CPU core with the heatmap.")
     parser.add_argument("-v", "--vmstat", type=str, default="", help="Path of vmstat log.")
     parser.add_argument("-vm", "--vmstat_mem", action='store_true', default=True, help="Show memory status.")
     parser.add_argument("-vi", "--vmstat_io", action='store_true', default=False, help="Show io status.")
@@ -746,5 +1132,11 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--free", type=str, default="", help="Path of free log.")
     parser.add_argument("-pic", "--picture", action='store_true', default=False, help="Save as picture.")
     parser.add_argument("-hg", "--hogs", type=str, default="", help="Path of hogs log for QNX.")
+    parser.add_argument("-io", "--iostat", type=str, default="", help="Path of iostat -x log.")
+    parser.add_argument("-sd", "--sar_dev", type=str, default="", help="Path of sar -n DEV log.")
+    parser.add_argument("-tp", "--top", type=str, default="", help="Path of top -b log.")
+    parser.add_argument("-mi", "--meminfo", type=str, default="", help="Path of /proc/meminfo snapshots.")
+    parser.add_argument("-sc", "--save_csv", action='store_true', default=False, help="Save intermediate csv files.")
+    parser.add_argument("-sv", "--serve", type=int, default=0, help="Port of local query server for pidstat, mpstat and vmstat logs.")
     args = parser.parse_args()
     main(args)